@@ -1,36 +1,101 @@
 # Vercel Python Serverless Function
 # Endpoint: POST /api/calculate
 
+from collections import OrderedDict
 from http.server import BaseHTTPRequestHandler
+import hashlib
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Import our calculation engine
-from .calculation_engine import calculate_sprinkler_system
+from .calculation_engine import calculate_sprinkler_system, validate_input
+
+
+def loads(body: bytearray):
+    """Parse a JSON request body (bytes or bytearray)."""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def dumps(data) -> bytes:
+    """Serialize data to a UTF-8 JSON response body."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data).encode('utf-8')
+
+
+# Serialized responses for recently seen inputs (kept per warm instance)
+RESPONSE_CACHE_SIZE = 128
+response_cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+
+
+def cache_key(input_data) -> bytes:
+    """Hash a canonical (sorted keys) serialization of the input."""
+    if orjson is not None:
+        canonical = orjson.dumps(input_data, option=orjson.OPT_SORT_KEYS)
+    else:
+        canonical = json.dumps(input_data, sort_keys=True).encode('utf-8')
+    return hashlib.blake2b(canonical, digest_size=16).digest()
+
+
+def calculate_cached(input_data) -> bytes:
+    """Run the calculation and serialize it, reusing cached responses."""
+    key = cache_key(input_data)
+    payload = response_cache.get(key)
+    if payload is not None:
+        response_cache.move_to_end(key)
+        return payload
+    
+    payload = dumps(calculate_sprinkler_system(input_data))
+    response_cache[key] = payload
+    if len(response_cache) > RESPONSE_CACHE_SIZE:
+        response_cache.popitem(last=False)
+    return payload
 
 
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         try:
             # Read request body
-            content_length = int(self.headers.get('Content-Length', 0))
-            body = self.rfile.read(content_length)
+            if 'Content-Length' not in self.headers:
+                self.send_error_response(411, "Content-Length required")
+                return
+            content_length = self.headers['Content-Length'].strip()
+            if not content_length.isdecimal():
+                self.send_error_response(400, "Invalid Content-Length header")
+                return
+            content_length = int(content_length)
+            body = bytearray(content_length)
+            bytes_read = self.rfile.readinto(body)
+            if bytes_read < content_length:
+                del body[bytes_read:]
             
-            # Parse JSON
-            input_data = json.loads(body.decode('utf-8'))
+            # Parse JSON and reject malformed input before calculating
+            input_data = loads(body)
+            validate_input(input_data)
             
-            # Run calculation
-            result = calculate_sprinkler_system(input_data)
+            # Run calculation (or reuse the response for a repeated input)
+            payload = calculate_cached(input_data)
             
             # Send response
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Content-Length', str(len(payload)))
             self.end_headers()
             
-            self.wfile.write(json.dumps(result).encode('utf-8'))
+            self.wfile.write(payload)
             
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError
         except json.JSONDecodeError as e:
             self.send_error_response(400, f"Invalid JSON: {str(e)}")
+        except ValueError as e:
+            self.send_error_response(400, f"Invalid input: {str(e)}")
         except Exception as e:
             self.send_error_response(500, f"Server error: {str(e)}")
     
@@ -40,16 +105,20 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def send_error_response(self, code: int, message: str):
+        error_response = {
+            "success": False,
+            "error": message
+        }
+        payload = dumps(error_response)
+        
         self.send_response(code)
         self.send_header('Content-Type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(payload)))
         self.end_headers()
         
-        error_response = {
-            "success": False,
-            "error": message
-        }
-        self.wfile.write(json.dumps(error_response).encode('utf-8'))
+        self.wfile.write(payload)
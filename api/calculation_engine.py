@@ -10,8 +10,11 @@ Original Author: Arnulf Snekvik
 Extraction Date: 2026-01-08
 """
 
-import math
-from typing import Dict, List, Any, Optional
+import bisect
+import functools
+from math import ceil, isfinite, sqrt
+import operator
+from typing import Dict, List, Any, Optional, Tuple
 
 # =============================================================================
 # CONSTANTS AND TABLES (from NS 12845 standard)
@@ -25,6 +28,10 @@ C_FAKTOR_JUSTERING = {
     140: 1.33
 }
 
+# Tabulated C-factors (evenly spaced by 10) and their adjustments
+C_VERDIER = (100, 110, 120, 130, 140)
+C_JUSTERING = tuple(C_FAKTOR_JUSTERING[c] for c in C_VERDIER)
+
 EKVIVALENT_RORLENGDE_VENTILER = {
     "Sluseventil": {
         "50": 0.38, "65": 0.51, "80": 0.63, "100": 0.81, 
@@ -48,16 +55,76 @@ EKVIVALENT_RORLENGDE_VENTILER = {
     }
 }
 
+# Valve equivalent lengths keyed by (valve type, dimension)
+VALVE_TABLE = {
+    (valve_type, dim): length
+    for valve_type, lengths in EKVIVALENT_RORLENGDE_VENTILER.items()
+    for dim, length in lengths.items()
+}
+
 # Standard diameters (mm)
-DIAMETERE = [20, 25, 32, 40, 50, 65, 80, 100, 150, 200, 250]
+DIAMETERE = (20, 25, 32, 40, 50, 65, 80, 100, 150, 200, 250)
+
+# Boundaries between neighbouring standard diameters
+DIAMETER_MIDPOINTS = tuple((a + b) / 2 for a, b in zip(DIAMETERE, DIAMETERE[1:]))
 
 # Equivalent lengths for fittings at C=120 (meters)
 # Index corresponds to DIAMETERE
-EQ_90_BEND = [0.76, 0.77, 1.0, 1.2, 1.5, 1.9, 2.4, 3.0, 4.3, 5.7, 7.4]
-EQ_90_BEND_SVEISET = [0.30, 0.36, 0.49, 0.56, 0.69, 0.88, 1.1, 1.4, 2.0, 2.6, 3.4]
-EQ_45_BEND = [0.34, 0.40, 0.55, 0.66, 0.76, 1.0, 1.3, 1.6, 2.3, 3.1, 3.9]
-EQ_T_STYKKE = [1.3, 1.5, 2.1, 2.4, 2.9, 3.8, 4.8, 6.1, 8.6, 11.0, 14.0]
-
+EQ_90_BEND = (0.76, 0.77, 1.0, 1.2, 1.5, 1.9, 2.4, 3.0, 4.3, 5.7, 7.4)
+EQ_90_BEND_SVEISET = (0.30, 0.36, 0.49, 0.56, 0.69, 0.88, 1.1, 1.4, 2.0, 2.6, 3.4)
+EQ_45_BEND = (0.34, 0.40, 0.55, 0.66, 0.76, 1.0, 1.3, 1.6, 2.3, 3.1, 3.9)
+EQ_T_STYKKE = (1.3, 1.5, 2.1, 2.4, 2.9, 3.8, 4.8, 6.1, 8.6, 11.0, 14.0)
+
+# Fitting equivalent lengths per diameter:
+# FITTING_LENGTHS[d_index] = (90 bend, T-piece, 45 bend)
+FITTING_LENGTHS = tuple(zip(EQ_90_BEND, EQ_T_STYKKE, EQ_45_BEND))
+
+
+def finite_float(value: Any) -> float:
+    """Cast to float, rejecting NaN and infinity (float() accepts "nan", "inf")."""
+    number = float(value)
+    if not isfinite(number):
+        raise ValueError(f"could not convert {value!r} to a finite number")
+    return number
+
+
+# Input schemas: (key, default, type) per column of a parsed row.
+# Nodes after node 1 are parsed with NODE_SCHEMA (see parse_node_row).
+NODE_SCHEMA = [
+    ("k_faktor", 80, finite_float),
+    ("min_trykk_bar", 0.5, finite_float),
+    ("diameter_mm", 27.3, finite_float),
+    ("lengde_m", 0, finite_float),
+    ("antall_90_bend", 0, int),
+    ("antall_tstykker", 1, int),
+    ("er_grenror", False, bool),
+    ("er_ekv_kfaktor", False, bool),
+]
+(NODE_K, NODE_MIN_P, NODE_DIAMETER, NODE_LENGTH,
+ NODE_N90, NODE_NT, NODE_IS_BRANCH, NODE_USE_EKV_K) = range(len(NODE_SCHEMA))
+
+# An inline node only uses its K-factor: the columns after it describe
+# no branch pipe (and are never read from the input)
+INLINE_NODE_COLUMNS = (0.5, 0.0, 0.0, 0, 0, False, False)
+
+# Node 1 also sets the flow requirement, and RS1 has no T-piece by default
+NODE_1_SCHEMA = NODE_SCHEMA[:NODE_NT] + [
+    ("antall_tstykker", 0, int),
+    ("dekningsareal_m2", 12, finite_float),
+    ("krav_mm_m2", 5, finite_float),
+]
+NODE_AREA, NODE_KRAV = NODE_NT + 1, NODE_NT + 2
+
+RS_SCHEMA = [
+    ("diameter_mm", 36, finite_float),
+    ("lengde_m", 0, finite_float),
+    ("antall_90_bend", 0, int),
+    ("antall_tstykker", 0, int),
+]
+RS_DIAMETER, RS_LENGTH, RS_N90, RS_NT = range(len(RS_SCHEMA))
+
+# Upper bound on nodes / pipe sections accepted in one calculation
+MAX_ROWS = 1000
 
 # =============================================================================
 # HELPER FUNCTIONS
@@ -65,15 +132,104 @@ EQ_T_STYKKE = [1.3, 1.5, 2.1, 2.4, 2.9, 3.8, 4.8, 6.1, 8.6, 11.0, 14.0]
 
 def get_nearest_diameter_index(diameter_mm: float) -> int:
     """Find index of nearest standard diameter."""
-    nearest = min(DIAMETERE, key=lambda x: abs(x - diameter_mm))
-    return DIAMETERE.index(nearest)
+    if not isfinite(diameter_mm):
+        # Every distance is inf/nan, where the original min() scan kept the first
+        return 0
+    # bisect_left sends ties on a midpoint to the smaller diameter
+    return bisect.bisect_left(DIAMETER_MIDPOINTS, diameter_mm)
+
+
+def get_c_factor_index(c_faktor: float) -> int:
+    """Find index of nearest tabulated C-factor (ties go to the lower one)."""
+    if not isfinite(c_faktor):
+        # ceil() raises on NaN/inf; the original min() scan gave the first C-factor
+        return 0
+    return max(0, min(len(C_VERDIER) - 1, ceil((c_faktor - 100) / 10 - 0.5)))
 
 
 def get_c_factor_adjustment(c_faktor: float) -> float:
     """Get C-factor adjustment multiplier for equivalent lengths."""
-    c_verdier = [100, 110, 120, 130, 140]
-    nearest_c = min(c_verdier, key=lambda x: abs(x - c_faktor))
-    return C_FAKTOR_JUSTERING.get(nearest_c, 1.00)
+    return C_JUSTERING[get_c_factor_index(c_faktor)]
+
+
+@functools.lru_cache(maxsize=256)
+def _hw_const(c_factor: float, diameter_mm: float) -> float:
+    """Flow independent Hazen-Williams factor 6.05 * 10^5 / (C^1.85 * D^4.87)."""
+    return 6.05e5 / (c_factor ** 1.85 * diameter_mm ** 4.87)
+
+
+def _hw_drop(flow_lpm: float, c_factor: float, diameter_mm: float) -> float:
+    """Hazen-Williams kernel. Assumes flow_lpm > 0 and diameter_mm > 0."""
+    # Hazen-Williams: p = 6.05 * 10^5 * Q^1.85 / (C^1.85 * D^4.87)
+    return _hw_const(c_factor, diameter_mm) * flow_lpm ** 1.85
+
+
+@functools.lru_cache(maxsize=256)
+def _fittings(diameter_mm: float, c_factor: float) -> Tuple[float, float, float, float]:
+    """
+    Fitting lengths (90 bend, T-piece, 45 bend) and C-factor adjustment.
+    
+    The adjustment is returned separately so callers multiply count *
+    length * adjustment in the original order (the rounded lengths in the
+    output depend on it).
+    """
+    return FITTING_LENGTHS[get_nearest_diameter_index(diameter_mm)] + (get_c_factor_adjustment(c_factor),)
+
+
+def _eq_len(
+    fittings: tuple,
+    num_90_bends: int,
+    num_t_pieces: int,
+    num_45_bends: int
+) -> float:
+    """Equivalent length kernel over one _fittings entry."""
+    bend90, t, bend45, c_adjustment = fittings
+    return (
+        num_90_bends * bend90 * c_adjustment
+        + num_t_pieces * t * c_adjustment
+        + num_45_bends * bend45 * c_adjustment
+    )
+
+
+def validate_input(input_data: Any) -> None:
+    """
+    Check the shape of the input before any calculation.
+    
+    Raises ValueError describing the first problem found.
+    """
+    if not isinstance(input_data, dict):
+        raise ValueError("Input must be a JSON object")
+    
+    if not isinstance(input_data.get("generelle_parametre", {}), dict):
+        raise ValueError("generelle_parametre must be an object")
+    
+    ventiler = input_data.get("ventiler", {})
+    if not isinstance(ventiler, dict) or not all(isinstance(v, dict) for v in ventiler.values()):
+        raise ValueError("ventiler must be an object of objects")
+    
+    for key in ("noder", "rettstrekk"):
+        items = input_data.get(key, [])
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValueError(f"{key} must be a list of objects")
+        if len(items) > MAX_ROWS:
+            raise ValueError(f"{key} has {len(items)} entries (max {MAX_ROWS})")
+
+
+def parse_row(data: Dict[str, Any], schema: List[tuple]) -> tuple:
+    """Convert an input dict to a tuple of typed values in schema order."""
+    return tuple(cast(data.get(key, default)) for key, default, cast in schema)
+
+
+def parse_node_row(data: Dict[str, Any]) -> tuple:
+    """
+    Parse a node after node 1 through NODE_SCHEMA.
+    
+    Only a branch node (er_grenror) reads its branch pipe columns; an
+    inline node only reads its K-factor.
+    """
+    if data.get("er_grenror", False):
+        return parse_row(data, NODE_SCHEMA)
+    return (finite_float(data.get("k_faktor", 80)),) + INLINE_NODE_COLUMNS
 
 
 def hazen_williams_pressure_drop(
@@ -89,9 +245,7 @@ def hazen_williams_pressure_drop(
     if diameter_mm <= 0 or flow_lpm <= 0:
         return 0.0
     
-    # Hazen-Williams: p = 6.05 * 10^5 * Q^1.85 / (C^1.85 * D^4.87)
-    p_tap_m = (6.05 * 10**5) * (flow_lpm ** 1.85) / ((c_factor ** 1.85) * (diameter_mm ** 4.87))
-    return p_tap_m
+    return _hw_drop(flow_lpm, c_factor, diameter_mm)
 
 
 def calculate_equivalent_length(
@@ -102,34 +256,24 @@ def calculate_equivalent_length(
     num_45_bends: int = 0
 ) -> float:
     """Calculate equivalent pipe length for fittings."""
-    d_index = get_nearest_diameter_index(diameter_mm)
-    c_adjustment = get_c_factor_adjustment(c_factor)
-    
-    eq_length = 0.0
-    eq_length += num_90_bends * EQ_90_BEND[d_index] * c_adjustment
-    eq_length += num_t_pieces * EQ_T_STYKKE[d_index] * c_adjustment
-    eq_length += num_45_bends * EQ_45_BEND[d_index] * c_adjustment
-    
-    return eq_length
+    return _eq_len(
+        _fittings(diameter_mm, c_factor),
+        num_90_bends, num_t_pieces, num_45_bends
+    )
 
 
+@functools.lru_cache(maxsize=256)
 def calculate_valve_equivalent_length(
     valve_type: str,
     diameter_str: str,
     c_factor: float
 ) -> float:
     """Calculate equivalent length for a valve."""
-    if valve_type not in EKVIVALENT_RORLENGDE_VENTILER:
+    base_length = VALVE_TABLE.get((valve_type, diameter_str))
+    if base_length is None:
         return 0.0
     
-    valve_data = EKVIVALENT_RORLENGDE_VENTILER[valve_type]
-    if diameter_str not in valve_data or diameter_str == "NA":
-        return 0.0
-    
-    base_length = valve_data[diameter_str]
-    c_adjustment = get_c_factor_adjustment(c_factor)
-    
-    return base_length * c_adjustment
+    return base_length * get_c_factor_adjustment(c_factor)
 
 
 # =============================================================================
@@ -153,7 +297,7 @@ def calculate_node_1(
     This is the starting point. RS1 is the pipe from sprinkler 1 to node 2.
     """
     # Calculate flow from K-factor: Q = K * sqrt(P)
-    flow_from_k = k_factor * math.sqrt(min_pressure_bar)
+    flow_from_k = k_factor * sqrt(min_pressure_bar)
     
     # Calculate flow from water requirement: Q = density * area
     flow_from_requirement = water_requirement_mm_m2 * coverage_area_m2
@@ -166,8 +310,8 @@ def calculate_node_1(
     pressure_at_node = max(actual_pressure_bar, min_pressure_bar)
     
     # Calculate equivalent length for fittings in RS1
-    eq_length = calculate_equivalent_length(
-        pipe_diameter_mm, c_factor, num_90_bends, num_t_pieces
+    eq_length = _eq_len(
+        _fittings(pipe_diameter_mm, c_factor), num_90_bends, num_t_pieces, 0
     )
     total_length = pipe_length_m + eq_length
     
@@ -177,95 +321,78 @@ def calculate_node_1(
     # Pressure at inlet of RS1 (node 2 side)
     pressure_after_rs1 = pressure_at_node + (pressure_drop_per_m * total_length)
     
+    # Node 1 and its embedded RS1 result share these values
+    flow_lpm = round(flow_lpm, 2)
+    pressure_at_node = round(pressure_at_node, 4)
+    pressure_drop_per_m = round(pressure_drop_per_m, 6)
+    eq_length = round(eq_length, 2)
+    total_length = round(total_length, 2)
+    pressure_after_rs1 = round(pressure_after_rs1, 4)
+    
     return {
         "node_nr": 1,
-        "flow_lpm": round(flow_lpm, 2),
-        "pressure_at_node_bar": round(pressure_at_node, 4),
-        "pressure_drop_per_m_bar": round(pressure_drop_per_m, 6),
-        "equivalent_length_m": round(eq_length, 2),
-        "total_length_m": round(total_length, 2),
-        "pressure_after_rs1_bar": round(pressure_after_rs1, 4),
-        "cumulative_flow_lpm": round(flow_lpm, 2),
+        "flow_lpm": flow_lpm,
+        "pressure_at_node_bar": pressure_at_node,
+        "pressure_drop_per_m_bar": pressure_drop_per_m,
+        "equivalent_length_m": eq_length,
+        "total_length_m": total_length,
+        "pressure_after_rs1_bar": pressure_after_rs1,
+        "cumulative_flow_lpm": flow_lpm,
         # RS1 result embedded
         "rs1": {
             "rs_nr": 1,
             "diameter_mm": pipe_diameter_mm,
             "physical_length_m": round(pipe_length_m, 2),
-            "equivalent_length_m": round(eq_length, 2),
-            "total_length_m": round(total_length, 2),
-            "flow_lpm": round(flow_lpm, 2),
-            "pressure_drop_per_m_bar": round(pressure_drop_per_m, 6),
-            "inlet_pressure_bar": round(pressure_at_node, 4),
-            "outlet_pressure_bar": round(pressure_after_rs1, 4)
+            "equivalent_length_m": eq_length,
+            "total_length_m": total_length,
+            "flow_lpm": flow_lpm,
+            "pressure_drop_per_m_bar": pressure_drop_per_m,
+            "inlet_pressure_bar": pressure_at_node,
+            "outlet_pressure_bar": pressure_after_rs1
         }
     }
 
 
-def calculate_node_inline(
-    node_nr: int,
+def calculate_node_k_factor(
     k_factor: float,
-    inlet_pressure_bar: float,
-    c_factor: float,
-    cumulative_flow_before: float
-) -> Dict[str, Any]:
-    """
-    Calculate an inline node (not on a branch pipe).
-    
-    Uses the inlet pressure to determine flow: Q = K * sqrt(P)
-    """
-    flow_lpm = k_factor * math.sqrt(inlet_pressure_bar)
-    cumulative_flow = cumulative_flow_before + flow_lpm
-    
-    return {
-        "node_nr": node_nr,
-        "flow_lpm": round(flow_lpm, 2),
-        "pressure_at_node_bar": round(inlet_pressure_bar, 4),
-        "k_factor_used": k_factor,
-        "is_branch": False,
-        "cumulative_flow_lpm": round(cumulative_flow, 2)
-    }
-
-
-def calculate_node_branch(
-    node_nr: int,
-    k_factor: float,
-    inlet_pressure_bar: float,
     min_pressure_bar: float,
     c_factor: float,
-    branch_diameter_mm: float,
-    branch_length_m: float,
-    num_90_bends: int,
-    num_t_pieces: int,
-    cumulative_flow_before: float,
+    is_branch: bool = False,
+    branch_diameter_mm: float = 0.0,
+    branch_length_m: float = 0.0,
+    num_90_bends: int = 0,
+    num_t_pieces: int = 0,
     use_equivalent_k: bool = False
-) -> Dict[str, Any]:
+) -> Tuple[float, Dict[str, Any]]:
     """
-    Calculate a branch node (grenrør).
+    Calculate the K-factor a node delivers flow with: Q = K * sqrt(P)
     
-    The sprinkler is on a side pipe (branch) that connects to the main.
-    We calculate an equivalent K-factor that accounts for the branch pipe losses.
+    This part of a node does not depend on its inlet pressure, so it can
+    be evaluated for every node before the pressure sweep. Returns the
+    K-factor and the node result fields describing it.
     
-    Logic:
+    For a branch node (grenrør) the sprinkler is on a side pipe (branch)
+    that connects to the main. With use_equivalent_k we calculate an
+    equivalent K-factor that accounts for the branch pipe losses:
     1. At minimum pressure (e.g., 0.5 bar), flow = K * sqrt(min_p)
     2. This flow through the branch causes a pressure drop
     3. Pressure at the T-junction must be higher to deliver min_p at sprinkler
     4. Equivalent K-factor = flow / sqrt(pressure_at_junction)
-    5. Actual flow uses inlet_pressure_bar with equivalent K
     """
-    if branch_diameter_mm <= 0:
-        # No branch pipe defined, treat as inline
-        return calculate_node_inline(node_nr, k_factor, inlet_pressure_bar, c_factor, cumulative_flow_before)
+    if not is_branch or branch_diameter_mm <= 0:
+        # Inline node, or no branch pipe defined (treat as inline)
+        return k_factor, {"k_factor_used": k_factor, "is_branch": False}
     
     # Calculate equivalent length for branch fittings
-    eq_length = calculate_equivalent_length(
-        branch_diameter_mm, c_factor, num_90_bends, num_t_pieces
+    eq_length = _eq_len(
+        _fittings(branch_diameter_mm, c_factor), num_90_bends, num_t_pieces, 0
     )
     total_branch_length = branch_length_m + eq_length
     
     if use_equivalent_k and total_branch_length > 0:
         # Equivalent K-factor method
         # Step 1: Flow at minimum pressure
-        flow_at_min_p = k_factor * math.sqrt(min_pressure_bar)
+        flow_at_min_p = k_factor * sqrt(min_pressure_bar)
         
         # Step 2: Pressure drop in branch at this flow
         p_drop_m = hazen_williams_pressure_drop(flow_at_min_p, c_factor, branch_diameter_mm)
@@ -275,92 +402,170 @@ def calculate_node_branch(
         pressure_at_junction = min_pressure_bar + branch_pressure_drop
         
         # Step 4: Equivalent K-factor
-        k_equivalent = flow_at_min_p / math.sqrt(pressure_at_junction)
-        
-        # Step 5: Actual flow using inlet pressure with equivalent K
-        flow_lpm = k_equivalent * math.sqrt(inlet_pressure_bar)
+        k_equivalent = flow_at_min_p / sqrt(pressure_at_junction)
         
-        cumulative_flow = cumulative_flow_before + flow_lpm
-        
-        return {
-            "node_nr": node_nr,
-            "flow_lpm": round(flow_lpm, 2),
-            "pressure_at_node_bar": round(inlet_pressure_bar, 4),
+        return k_equivalent, {
             "k_factor_original": k_factor,
             "k_equivalent": round(k_equivalent, 2),
             "branch_length_m": round(total_branch_length, 2),
             "branch_pressure_drop_bar": round(branch_pressure_drop, 4),
-            "is_branch": True,
-            "cumulative_flow_lpm": round(cumulative_flow, 2)
-        }
-    else:
-        # Simple branch (not using equivalent K) - just use inlet pressure
-        flow_lpm = k_factor * math.sqrt(inlet_pressure_bar)
-        cumulative_flow = cumulative_flow_before + flow_lpm
-        
-        return {
-            "node_nr": node_nr,
-            "flow_lpm": round(flow_lpm, 2),
-            "pressure_at_node_bar": round(inlet_pressure_bar, 4),
-            "k_factor_used": k_factor,
-            "branch_length_m": round(total_branch_length, 2),
-            "is_branch": True,
-            "cumulative_flow_lpm": round(cumulative_flow, 2)
+            "is_branch": True
         }
+    
+    # Simple branch (not using equivalent K) - just use inlet pressure
+    return k_factor, {
+        "k_factor_used": k_factor,
+        "branch_length_m": round(total_branch_length, 2),
+        "is_branch": True
+    }
 
 
-def calculate_pipe_section(
-    rs_nr: int,
-    diameter_mm: float,
-    length_m: float,
+def node_result(
+    node_nr: int,
+    k_fields: Dict[str, Any],
+    inlet_pressure_bar: float,
     flow_lpm: float,
+    cumulative_flow_lpm: float
+) -> Dict[str, Any]:
+    """Build a node result (k_fields from calculate_node_k_factor)."""
+    return {
+        "node_nr": node_nr,
+        "flow_lpm": round(flow_lpm, 2),
+        "pressure_at_node_bar": round(inlet_pressure_bar, 4),
+        **k_fields,
+        "cumulative_flow_lpm": round(cumulative_flow_lpm, 2)
+    }
+
+
+def calculate_node_inline(
+    node_nr: int,
+    k_factor: float,
     inlet_pressure_bar: float,
     c_factor: float,
+    cumulative_flow_before: float
+) -> Dict[str, Any]:
+    """
+    Calculate an inline node (not on a branch pipe).
+    
+    Uses the inlet pressure to determine flow: Q = K * sqrt(P)
+    """
+    k_used, k_fields = calculate_node_k_factor(k_factor, 0.0, c_factor)
+    flow_lpm = k_used * sqrt(inlet_pressure_bar)
+    return node_result(
+        node_nr, k_fields, inlet_pressure_bar, flow_lpm, cumulative_flow_before + flow_lpm
+    )
+
+
+def calculate_node_branch(
+    node_nr: int,
+    k_factor: float,
+    inlet_pressure_bar: float,
+    min_pressure_bar: float,
+    c_factor: float,
+    branch_diameter_mm: float,
+    branch_length_m: float,
+    num_90_bends: int,
+    num_t_pieces: int,
+    cumulative_flow_before: float,
+    use_equivalent_k: bool = False
+) -> Dict[str, Any]:
+    """
+    Calculate a branch node (grenrør).
+    
+    The K-factor (or equivalent K-factor) comes from calculate_node_k_factor;
+    the actual flow uses inlet_pressure_bar with that K-factor.
+    """
+    k_used, k_fields = calculate_node_k_factor(
+        k_factor, min_pressure_bar, c_factor, True,
+        branch_diameter_mm, branch_length_m, num_90_bends, num_t_pieces,
+        use_equivalent_k
+    )
+    flow_lpm = k_used * sqrt(inlet_pressure_bar)
+    return node_result(
+        node_nr, k_fields, inlet_pressure_bar, flow_lpm, cumulative_flow_before + flow_lpm
+    )
+
+
+def calculate_pipe_section_lengths(
+    diameter_mm: float,
+    length_m: float,
+    c_factor: float,
     num_90_bends: int = 0,
     num_t_pieces: int = 0,
     valve_equivalent_length_m: float = 0.0
-) -> Dict[str, Any]:
+) -> Tuple[float, float]:
     """
-    Calculate pressure drop through a pipe section (Rettstrekk).
+    Calculate (equivalent length, total length) of a pipe section.
     
-    RS N connects node N to node N+1.
-    Flow is the cumulative flow at node N.
+    The equivalent length covers fittings and valves. Neither depends on
+    the flow, so they can be evaluated for every section up front.
     """
-    if diameter_mm <= 0 or flow_lpm <= 0:
-        return {
-            "rs_nr": rs_nr,
-            "diameter_mm": diameter_mm,
-            "physical_length_m": round(length_m, 2),
-            "equivalent_length_m": 0.0,
-            "total_length_m": round(length_m, 2),
-            "flow_lpm": 0.0,
-            "pressure_drop_per_m_bar": 0.0,
-            "pressure_drop_total_bar": 0.0,
-            "inlet_pressure_bar": round(inlet_pressure_bar, 4),
-            "outlet_pressure_bar": round(inlet_pressure_bar, 4)
-        }
-    
     # Calculate equivalent length for fittings
-    eq_length = calculate_equivalent_length(
-        diameter_mm, c_factor, num_90_bends, num_t_pieces
+    eq_length = _eq_len(
+        _fittings(diameter_mm, c_factor), num_90_bends, num_t_pieces, 0
     )
     
     # Total equivalent length including valves
     total_length = length_m + eq_length + valve_equivalent_length_m
     
-    # Calculate pressure drop
-    pressure_drop_per_m = hazen_williams_pressure_drop(flow_lpm, c_factor, diameter_mm)
-    pressure_drop_total = pressure_drop_per_m * total_length
+    return eq_length + valve_equivalent_length_m, total_length
+
+
+def _hw_factor(diameter_mm: float, c_factor: float) -> Optional[float]:
+    """_hw_const for a pipe section, or None for a section without diameter."""
+    if diameter_mm <= 0:
+        return None
+    return _hw_const(c_factor, diameter_mm)
+
+
+def _pipe_section_state(
+    hw_factor: Optional[float],
+    total_length_m: float,
+    flow_lpm: float,
+    inlet_pressure_bar: float
+) -> Tuple[float, float, float, float]:
+    """
+    Pressure drop through a pipe section with a known total length.
+    
+    hw_factor is the section's _hw_factor. Returns (flow, pressure drop
+    per meter, total pressure drop, outlet pressure). A section without
+    diameter or flow carries no flow.
+    """
+    if hw_factor is None or flow_lpm <= 0:
+        return 0.0, 0.0, 0.0, inlet_pressure_bar
+    
+    # Hazen-Williams: p = 6.05 * 10^5 * Q^1.85 / (C^1.85 * D^4.87)
+    pressure_drop_per_m = hw_factor * flow_lpm ** 1.85
+    pressure_drop_total = pressure_drop_per_m * total_length_m
     
     # Outlet pressure (towards water supply)
-    outlet_pressure_bar = inlet_pressure_bar + pressure_drop_total
+    return flow_lpm, pressure_drop_per_m, pressure_drop_total, inlet_pressure_bar + pressure_drop_total
+
+
+def pipe_section_result(
+    rs_nr: int,
+    diameter_mm: float,
+    length_m: float,
+    equivalent_length_m: float,
+    total_length_m: float,
+    inlet_pressure_bar: float,
+    flow_lpm: float,
+    pressure_drop_per_m: float,
+    pressure_drop_total: float,
+    outlet_pressure_bar: float
+) -> Dict[str, Any]:
+    """Build a pipe section result from its lengths and _pipe_section_state."""
+    if flow_lpm <= 0:
+        # No flow through the section, so no fitting or valve losses either
+        equivalent_length_m = 0.0
+        total_length_m = length_m
     
     return {
         "rs_nr": rs_nr,
         "diameter_mm": diameter_mm,
         "physical_length_m": round(length_m, 2),
-        "equivalent_length_m": round(eq_length + valve_equivalent_length_m, 2),
-        "total_length_m": round(total_length, 2),
+        "equivalent_length_m": round(equivalent_length_m, 2),
+        "total_length_m": round(total_length_m, 2),
         "flow_lpm": round(flow_lpm, 2),
         "pressure_drop_per_m_bar": round(pressure_drop_per_m, 6),
         "pressure_drop_total_bar": round(pressure_drop_total, 4),
@@ -369,6 +574,69 @@ def calculate_pipe_section(
     }
 
 
+def calculate_pipe_section(
+    rs_nr: int,
+    diameter_mm: float,
+    length_m: float,
+    flow_lpm: float,
+    inlet_pressure_bar: float,
+    c_factor: float,
+    num_90_bends: int = 0,
+    num_t_pieces: int = 0,
+    valve_equivalent_length_m: float = 0.0
+) -> Dict[str, Any]:
+    """
+    Calculate pressure drop through a pipe section (Rettstrekk).
+    
+    RS N connects node N to node N+1.
+    Flow is the cumulative flow at node N.
+    """
+    eq_length, total_length = calculate_pipe_section_lengths(
+        diameter_mm, length_m, c_factor, num_90_bends, num_t_pieces, valve_equivalent_length_m
+    )
+    
+    return pipe_section_result(
+        rs_nr, diameter_mm, length_m, eq_length, total_length, inlet_pressure_bar,
+        *_pipe_section_state(_hw_factor(diameter_mm, c_factor), total_length, flow_lpm, inlet_pressure_bar)
+    )
+
+
+def _sweep(
+    k_used: List[float],
+    sections: List[Optional[Tuple[Optional[float], float]]],
+    cumulative_flow: float,
+    pressure: float
+) -> Tuple[List[tuple], List[Optional[tuple]], float, float]:
+    """
+    Serial flow/pressure sweep over nodes 2, 3, ... towards the supply.
+    
+    Works on plain floats only: the K-factor of each node and the
+    (_hw_factor, total length) of the pipe section after it, or None. The
+    factor is cached per (C, diameter), so each section costs one pow.
+    Flow and pressure are carried forward at output precision.
+    
+    Returns per node (inlet pressure, flow, cumulative flow), per section
+    the inlet pressure followed by the _pipe_section_state tuple (or None),
+    and the final cumulative flow and pressure.
+    """
+    node_states = []
+    section_states = []
+    for k, section in zip(k_used, sections):
+        flow = k * sqrt(pressure)
+        node_states.append((pressure, flow, cumulative_flow + flow))
+        cumulative_flow = round(cumulative_flow + flow, 2)
+        
+        if section is None:
+            section_states.append(None)
+            continue
+        hw_factor, total_length = section
+        state = _pipe_section_state(hw_factor, total_length, cumulative_flow, pressure)
+        section_states.append((pressure, *state))
+        pressure = round(state[3], 4)
+    
+    return node_states, section_states, cumulative_flow, pressure
+
+
 # =============================================================================
 # MAIN ENTRY POINT
 # =============================================================================
@@ -388,10 +656,15 @@ def calculate_sprinkler_system(input_data: Dict[str, Any]) -> Dict[str, Any]:
     - Work backwards towards supply, adding pressure drops
     """
     try:
+        validate_input(input_data)
+        
         # Extract general parameters
         params = input_data.get("generelle_parametre", {})
-        c_factor = float(params.get("c_faktor", 120))
-        building_height_m = float(params.get("hoyde_anlegg_m", 0))
+        c_factor = finite_float(params.get("c_faktor", 120))
+        building_height_m = finite_float(params.get("hoyde_anlegg_m", 0))
+        
+        # C-factor adjustment is constant for the whole system
+        c_adj = get_c_factor_adjustment(c_factor)
         
         # Calculate valve equivalent lengths per pipe section
         ventiler = input_data.get("ventiler", {})
@@ -401,19 +674,29 @@ def calculate_sprinkler_system(input_data: Dict[str, Any]) -> Dict[str, Any]:
             dim = valve_data.get("dimensjon", "NA")
             rs_nr = int(valve_data.get("tilkoblet_rs", 0))
             if dim != "NA" and rs_nr > 0:
-                eq_len = calculate_valve_equivalent_length(valve_name, dim, c_factor)
+                base = VALVE_TABLE.get((valve_name, dim))
+                eq_len = base * c_adj if base is not None else 0.0
                 valve_eq_per_rs[rs_nr] = valve_eq_per_rs.get(rs_nr, 0) + eq_len
                 total_valve_eq_length += eq_len
         
         # Get and sort nodes
         noder = input_data.get("noder", [])
-        noder = sorted(noder, key=lambda x: x.get("node_nr", 0))
+        if not noder:
+            return {"success": False, "error": "No nodes provided"}
         
-        # Get pipe sections (RS2 onwards - RS1 is in node 1)
-        rettstrekk = input_data.get("rettstrekk", [])
-        rettstrekk = sorted(rettstrekk, key=lambda x: x.get("rs_nr", 0))
+        # Already ordered input (the usual case) is a single linear pass
+        # for timsort. A node without a number can never be preceded by
+        # node 1.
+        try:
+            noder = sorted(noder, key=operator.itemgetter("node_nr"))
+        except KeyError:
+            return {"success": False, "error": "First node must be node_nr=1"}
+        if noder[0]["node_nr"] != 1:
+            return {"success": False, "error": "First node must be node_nr=1"}
         
-        # Create lookup dict for rettstrekk by number
+        # Get pipe sections (RS2 onwards - RS1 is in node 1) and create
+        # lookup of rettstrekk by number (parsed when a node uses them)
+        rettstrekk = input_data.get("rettstrekk", [])
         rs_dict = {rs.get("rs_nr"): rs for rs in rettstrekk}
         
         # Results
@@ -421,83 +704,84 @@ def calculate_sprinkler_system(input_data: Dict[str, Any]) -> Dict[str, Any]:
         rs_results = []
         
         # STEP 1: Calculate Node 1 and RS1
-        if not noder:
-            return {"success": False, "error": "No nodes provided"}
-        
-        node_1_data = noder[0]
-        if node_1_data.get("node_nr") != 1:
-            return {"success": False, "error": "First node must be node_nr=1"}
+        node_1 = parse_row(noder[0], NODE_1_SCHEMA)
+        node_rows = [parse_node_row(node_data) for node_data in noder[1:]]
         
         node_1_result = calculate_node_1(
-            k_factor=float(node_1_data.get("k_faktor", 80)),
-            min_pressure_bar=float(node_1_data.get("min_trykk_bar", 0.5)),
-            coverage_area_m2=float(node_1_data.get("dekningsareal_m2", 12)),
-            water_requirement_mm_m2=float(node_1_data.get("krav_mm_m2", 5)),
-            pipe_diameter_mm=float(node_1_data.get("diameter_mm", 27.3)),
-            pipe_length_m=float(node_1_data.get("lengde_m", 0)),
+            k_factor=node_1[NODE_K],
+            min_pressure_bar=node_1[NODE_MIN_P],
+            coverage_area_m2=node_1[NODE_AREA],
+            water_requirement_mm_m2=node_1[NODE_KRAV],
+            pipe_diameter_mm=node_1[NODE_DIAMETER],
+            pipe_length_m=node_1[NODE_LENGTH],
             c_factor=c_factor,
-            num_90_bends=int(node_1_data.get("antall_90_bend", 0)),
-            num_t_pieces=int(node_1_data.get("antall_tstykker", 0))
+            num_90_bends=node_1[NODE_N90],
+            num_t_pieces=node_1[NODE_NT]
         )
         node_results.append(node_1_result)
         rs_results.append(node_1_result["rs1"])
         
         # Track cumulative flow and current pressure
+        # (carried forward at output precision, like the original script)
         cumulative_flow = node_1_result["flow_lpm"]
         current_pressure = node_1_result["pressure_after_rs1_bar"]
         
-        # STEP 2: Calculate remaining nodes (2, 3, 4, ...)
-        for i, node_data in enumerate(noder[1:], start=2):
-            node_nr = node_data.get("node_nr", i)
-            
-            # Check if this is a branch node
-            is_branch = node_data.get("er_grenror", False)
-            use_ekv_k = node_data.get("er_ekv_kfaktor", False)
-            
-            if is_branch:
-                node_result = calculate_node_branch(
-                    node_nr=node_nr,
-                    k_factor=float(node_data.get("k_faktor", 80)),
-                    inlet_pressure_bar=current_pressure,
-                    min_pressure_bar=float(node_data.get("min_trykk_bar", 0.5)),
-                    c_factor=c_factor,
-                    branch_diameter_mm=float(node_data.get("diameter_mm", 27.3)),
-                    branch_length_m=float(node_data.get("lengde_m", 0)),
-                    num_90_bends=int(node_data.get("antall_90_bend", 0)),
-                    num_t_pieces=int(node_data.get("antall_tstykker", 1)),
-                    cumulative_flow_before=cumulative_flow,
-                    use_equivalent_k=use_ekv_k
-                )
-            else:
-                node_result = calculate_node_inline(
-                    node_nr=node_nr,
-                    k_factor=float(node_data.get("k_faktor", 80)),
-                    inlet_pressure_bar=current_pressure,
-                    c_factor=c_factor,
-                    cumulative_flow_before=cumulative_flow
-                )
-            
-            node_results.append(node_result)
-            cumulative_flow = node_result["cumulative_flow_lpm"]
-            
-            # STEP 3: Calculate RS for this node (RS N connects node N to node N+1)
-            rs_nr = node_nr
-            rs_data = rs_dict.get(rs_nr, {})
-            
-            if rs_data:
-                rs_result = calculate_pipe_section(
-                    rs_nr=rs_nr,
-                    diameter_mm=float(rs_data.get("diameter_mm", 36)),
-                    length_m=float(rs_data.get("lengde_m", 0)),
-                    flow_lpm=cumulative_flow,
-                    inlet_pressure_bar=current_pressure,
-                    c_factor=c_factor,
-                    num_90_bends=int(rs_data.get("antall_90_bend", 0)),
-                    num_t_pieces=int(rs_data.get("antall_tstykker", 0)),
-                    valve_equivalent_length_m=valve_eq_per_rs.get(rs_nr, 0)
-                )
-                rs_results.append(rs_result)
-                current_pressure = rs_result["outlet_pressure_bar"]
+        # K-factors do not depend on the inlet pressure, so evaluate them
+        # for all nodes before the pressure sweep
+        node_k = [
+            calculate_node_k_factor(
+                k_factor=row[NODE_K],
+                min_pressure_bar=row[NODE_MIN_P],
+                c_factor=c_factor,
+                is_branch=row[NODE_IS_BRANCH],
+                branch_diameter_mm=row[NODE_DIAMETER],
+                branch_length_m=row[NODE_LENGTH],
+                num_90_bends=row[NODE_N90],
+                num_t_pieces=row[NODE_NT],
+                use_equivalent_k=row[NODE_USE_EKV_K]
+            )
+            for row in node_rows
+        ]
+        
+        # Likewise the lengths of the pipe section after each node (RS N
+        # connects node N to node N+1) do not depend on the flow
+        sections = []
+        sweep_sections = []
+        for node_data in noder[1:]:
+            rs_nr = node_data["node_nr"]
+            rs_data = rs_dict.get(rs_nr)
+            if not rs_data:
+                sections.append(None)
+                sweep_sections.append(None)
+                continue
+            rs_row = parse_row(rs_data, RS_SCHEMA)
+            diameter_mm = rs_row[RS_DIAMETER]
+            length_m = rs_row[RS_LENGTH]
+            eq_length, total_length = calculate_pipe_section_lengths(
+                diameter_mm=diameter_mm,
+                length_m=length_m,
+                c_factor=c_factor,
+                num_90_bends=rs_row[RS_N90],
+                num_t_pieces=rs_row[RS_NT],
+                valve_equivalent_length_m=valve_eq_per_rs.get(rs_nr, 0)
+            )
+            sections.append((rs_nr, diameter_mm, length_m, eq_length, total_length))
+            sweep_sections.append((_hw_factor(diameter_mm, c_factor), total_length))
+        
+        # STEP 2 + 3: Sweep remaining nodes (2, 3, 4, ...) and their RS
+        node_states, section_states, cumulative_flow, current_pressure = _sweep(
+            [k_used for k_used, _ in node_k],
+            sweep_sections,
+            cumulative_flow,
+            current_pressure
+        )
+        
+        for node_data, (_, k_fields), state in zip(noder[1:], node_k, node_states):
+            node_results.append(node_result(node_data["node_nr"], k_fields, *state))
+        
+        for section, state in zip(sections, section_states):
+            if section is not None:
+                rs_results.append(pipe_section_result(*section, *state))
         
         # STEP 4: Add height adjustment (0.1 bar per meter)
         height_pressure = building_height_m * 0.1
@@ -515,7 +799,10 @@ def calculate_sprinkler_system(input_data: Dict[str, Any]) -> Dict[str, Any]:
             "ventil_ekvivalent_lengde": round(total_valve_eq_length, 2)
         }
         
-    except Exception as e:
+    # Bad input values (unconvertible fields, unorderable or unhashable
+    # numbers) and the math they lead to (negative pressures, K = 0,
+    # overflow). Anything else is a bug and propagates to the caller.
+    except (ValueError, TypeError, ArithmeticError) as e:
         return {
             "success": False,
             "error": str(e),
@@ -602,5 +889,11 @@ if __name__ == "__main__":
     
     result = calculate_sprinkler_system(test_input)
     
-    import json
-    print(json.dumps(result, indent=2))
+    try:
+        import orjson
+    except ImportError:
+        import json
+        print(json.dumps(result, indent=2))
+    else:
+        import sys
+        sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))